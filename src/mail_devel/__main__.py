@@ -2,7 +2,6 @@ import asyncio
 import logging
 import signal
 from argparse import Namespace
-from contextlib import suppress
 
 from . import VERSION, utils
 from .service import Service
@@ -10,26 +9,32 @@ from .service import Service
 _logger = logging.getLogger(__name__)
 
 
-async def sleep_forever() -> None:
-    with suppress(asyncio.CancelledError):
-        while True:
-            await asyncio.sleep(60)
-
-
-async def run(args: Namespace) -> None:
+async def run(args: Namespace, stop: asyncio.Event | None = None) -> None:
+    """Run the service until SIGINT, SIGTERM or until the stop event is set"""
     _logger.info(f"Version: {VERSION}")
-    loop = asyncio.get_event_loop()
+    loop = asyncio.get_running_loop()
     service = await Service.init(args)
+    stop = stop or asyncio.Event()
     async with service.start():
-        forever = asyncio.create_task(sleep_forever())
-        loop.add_signal_handler(signal.SIGINT, forever.cancel)
-        loop.add_signal_handler(signal.SIGTERM, forever.cancel)
-        await forever
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        try:
+            await stop.wait()
+        finally:
+            loop.remove_signal_handler(signal.SIGINT)
+            loop.remove_signal_handler(signal.SIGTERM)
 
 
 def main() -> None:
     args = Service.parse()
 
+    try:
+        import uvloop  # pylint: disable=import-outside-toplevel
+
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+
     utils.configure_logging("DEBUG" if args.debug else "INFO")
     asyncio.run(run(args))
 
@@ -1,3 +1,4 @@
+import hmac
 import logging
 from typing import Any
 
@@ -22,10 +23,11 @@ class IMAPAuthenticator(Login):
     async def authenticate(self, credentials: ServerCredentials) -> Identity:
         authcid = credentials.authcid
 
-        if authcid not in self.users_dict:
+        if self.users_dict.get(authcid) is None:
             self.users_dict[authcid] = UserMetadata(self.config, authcid)
 
-        if self.multi_user and isinstance(credentials, PlainCredentials):
+        # pylint: disable=unidiomatic-typecheck
+        if self.multi_user and type(credentials) is PlainCredentials:
             credentials = PlainCredentials(self.config.demo_user, credentials._secret)
 
         ident = await super().authenticate(credentials)
@@ -34,6 +36,8 @@ class IMAPAuthenticator(Login):
 
 
 class SMTPAuthenticator:
+    MECHANISMS = frozenset({"LOGIN", "PLAIN"})
+
     def __init__(self, user: str, password: str, multi_user: bool = False) -> None:
         self.user, self.password = map(ensure_bytes, (user, password))
         self.multi_user = multi_user
@@ -46,13 +50,13 @@ class SMTPAuthenticator:
         mechanism: str,
         auth_data: Any,
     ) -> AuthResult:
-        if mechanism not in ("LOGIN", "PLAIN"):
+        if mechanism not in self.MECHANISMS:
             return AuthResult(success=False, handled=False)
 
         if not isinstance(auth_data, LoginPassword):
             return AuthResult(success=False, handled=False)
 
-        if self.password != auth_data.password:
+        if not hmac.compare_digest(self.password, ensure_bytes(auth_data.password)):
             return AuthResult(success=False, handled=False)
 
         if not self.multi_user and self.user != auth_data.login:
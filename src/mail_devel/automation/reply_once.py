@@ -1,9 +1,16 @@
+import asyncio
+
 from mail_devel.builder import Builder
 from mail_devel.smtp import Logger, Message, Reply
 
+MARKER = "@mail-devel"
+
 
-def reply(message: Message, flags: set[str], _logger: Logger) -> Reply | None:
-    if "@mail-devel" not in message.get("References", ""):
-        return Reply(Builder.reply_mail(message), flags - {"Seen"})
+async def reply(message: Message, flags: set[str], _logger: Logger) -> Reply | None:
+    references = message.get("References")
+    if not references or MARKER not in references:
+        return Reply(
+            await asyncio.to_thread(Builder.reply_mail, message), flags - {"Seen"}
+        )
 
     return None
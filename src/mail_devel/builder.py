@@ -1,42 +1,93 @@
-import secrets
+import os
+import threading
 import uuid
-from email.message import Message
-from email.mime.multipart import MIMEMultipart
+from email.message import EmailMessage, Message
 from email.mime.text import MIMEText
 
 
+class _EntropyPool:
+    """Hand out random bytes from a buffer which is filled in larger chunks to
+    avoid a system call for every generated value"""
+
+    def __init__(self, size: int = 4096) -> None:
+        self.size: int = size
+        self.buffer: memoryview = memoryview(b"")
+        self.cursor: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+    def take(self, n: int) -> bytes:
+        with self.lock:
+            if self.cursor + n > len(self.buffer):
+                self.buffer = memoryview(os.urandom(max(self.size, n)))
+                self.cursor = 0
+
+            data = self.buffer[self.cursor : self.cursor + n].tobytes()
+            self.cursor += n
+            return data
+
+
+_entropy = _EntropyPool()
+
+
 class Builder:
     """Helper class to generate mails and randomized values"""
 
     @staticmethod
     def message_id() -> str:
-        return f"<{uuid.uuid4()}@mail-devel>"
+        return f"<{uuid.UUID(bytes=_entropy.take(16), version=4)}@mail-devel>"
 
     @staticmethod
     def mail_address() -> str:
-        return f"{secrets.token_hex(8)}@mail-devel"
+        return f"{_entropy.take(8).hex()}@mail-devel"
 
     @staticmethod
-    def reply_mail(message: Message) -> Message:
-        body = ""
+    def text_part(body: str) -> Message:
+        """Create a text/plain message. ASCII bodies skip the charset handling of
+        MIMEText and are set directly"""
+        if not body.isascii():
+            return MIMEText(body, _charset="utf-8")
+
+        message = Message()
+        message["MIME-Version"] = "1.0"
+        message["Content-Type"] = 'text/plain; charset="us-ascii"'
+        message["Content-Transfer-Encoding"] = "7bit"
+        message.set_payload(body)
+        return message
+
+    @staticmethod
+    def _decoded_payload(part: Message) -> str:
+        payload = part.get_payload(decode=True)
+        return payload.decode() if isinstance(payload, bytes) else ""
+
+    @staticmethod
+    def plain_body(message: Message) -> str:
+        """Return the first text/plain part of the message"""
+        if isinstance(message, EmailMessage):
+            body = message.get_body(preferencelist=("plain",))
+            return Builder._decoded_payload(body) if body else ""
+
         if message.is_multipart():
             for part in message.walk():
                 if part.get_content_type() == "text/plain":
-                    body = part.get_payload(decode=True).decode()
+                    return Builder._decoded_payload(part)
         elif message.get_content_type() == "text/plain":
-            body = message.get_payload(decode=True).decode()
+            return Builder._decoded_payload(message)
+        return ""
 
-        reply = MIMEMultipart()
+    @staticmethod
+    def reply_mail(message: Message) -> Message:
+        body = Builder.plain_body(message)
         if body:
-            body = "\n\n> " + body.replace("\n", "\n> ")
+            body = "\n\n> " + "\n> ".join(body.split("\n"))
 
-        reply.attach(MIMEText("Reply" + body))
+        reply = Builder.text_part("Reply" + body)
 
         reply.add_header("Message-Id", Builder.message_id())
         msg_id = message["Message-Id"]
         if msg_id:
+            references = message.get("References")
             reply.add_header("In-Reply-To", msg_id)
-            reply.add_header("References", f"{msg_id} {message.get('References', '')}")
+            reply.add_header("References", " ".join(filter(None, (msg_id, references))))
 
         reply.add_header("Subject", f"Re: {message['Subject']}")
         reply.add_header("To", message["From"])
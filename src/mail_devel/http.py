@@ -1,40 +1,153 @@
+import asyncio
+import base64
+import functools
+import gzip
 import hashlib
 import json
 import logging
+import multiprocessing
 import os
+import re
 import secrets
 import ssl
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import datetime
 from email import header, message_from_bytes, message_from_string, policy
 from email.errors import MessageDefect
 from email.message import Message
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from email.parser import BytesParser
 from importlib import resources
-from typing import Any, Tuple
+from typing import Any, Awaitable, Callable, NamedTuple, Tuple
 
 import aiohttp
 from aiohttp import web
+from aiohttp.log import access_logger
 from aiohttp.web import Request, Response, WebSocketResponse
 from pymap.backend.dict.mailbox import Message as PyMapMessage
 from pymap.parsing.specials import FetchRequirement
 from pymap.parsing.specials.flag import Flag
 
+from . import utils
 from .builder import Builder
-from .mailbox import TestMailboxDict
+from .mailbox import TestMailboxDict, get_message, system_flag
 from .utils import VERSION
 
+# BLAKE3 hashes large mails considerably faster than the builtin BLAKE2
+try:
+    from blake3 import blake3
+except ImportError:  # pragma: no cover
+    blake3 = None  # type: ignore[assignment,misc,unused-ignore]
+
 _logger = logging.getLogger(__name__)
 
 
 Mail = dict[str, Any]
 
+STATIC_TYPES = {"css": "text/css", "js": "text/javascript"}
 
-def decode_header(value: str) -> str:
+# Content types of the mail bodies which are shown in the frontend
+BODY_TYPES = frozenset({"text/plain", "text/html"})
+
+STRICT_POLICY = policy.compat32.clone(raise_on_defect=True)
+
+HEADER_PARSER = BytesParser(policy=policy.compat32)
+
+# RFC 2047 encoded words like =?utf-8?q?text?=
+ENCODED_WORD = re.compile(r"=\?[^?]+\?[bq]\?[^?]*\?=", re.IGNORECASE)
+
+# Maximum total size in bytes of the parsed mails kept for the downloads
+MAIL_CACHE_SIZE = 64 << 20
+
+# Maximum total size in bytes of the parsed stored mails to skip the parsing
+# on repeated access
+PARSED_CACHE_SIZE = 64 << 20
+
+# Maximum number of decoded headers of stored mails for the listings
+HEADER_CACHE_SIZE = 4096
+
+
+@dataclass(slots=True)
+class MailView:
+    """Mail as sent to the frontend. Unset optional fields are omitted"""
+
+    uid: int
+    flags: list[str]
+    header: dict[str, str]
+    date: datetime
+    body_plain: str | None = None
+    body_html: str | None = None
+    attachments: list[Mail] | None = None
+    source: str | None = None
+
+    def to_json(self) -> Mail:
+        return {
+            key: value
+            for key in self.__slots__
+            if (value := getattr(self, key)) is not None
+        }
+
+
+class StaticResource(NamedTuple):
+    body: bytes
+    compressed: bytes
+    etag: str
+    compressed_etag: str
+
+
+class MailParts(NamedTuple):
+    body_plain: str | None
+    body_html: str | None
+    attachments: list[str | None]
+    by_name: dict[str, Message]
+
+
+class CachedHeader(NamedTuple):
+    internal_date: datetime
+    header: dict[str, str]
+
+
+class ParsedMail(NamedTuple):
+    internal_date: datetime
+    content: bytes
+    message: Message
+    msg_hash: str
+    parts: MailParts
+
+
+class CachedMail(NamedTuple):
+    account: str
+    mailbox: str
+    uid: int
+    message: Message
+    attachments: dict[str, Message]
+    content: bytes
+
+
+@functools.lru_cache(maxsize=4096)
+def _decode_encoded_words(value: str) -> str:
+    # Subjects and addresses repeat heavily across the mails of a mailbox
     return str(header.make_header(header.decode_header(value)))
 
 
+def decode_header(value: str) -> str:
+    if not isinstance(value, str):
+        return str(header.make_header(header.decode_header(value)))
+
+    # Values without encoded words are returned unchanged anyway
+    if "=?" not in value or not ENCODED_WORD.search(value):
+        return value
+    return _decode_encoded_words(value)
+
+
+def decode_headers(message: Message) -> dict[str, str]:
+    return {k.lower(): decode_header(v) for k, v in message.items()}
+
+
 def decode_payload(part: Message) -> str:
     payload = part.get_payload(decode=True)
     if isinstance(payload, bytes):
@@ -49,6 +162,62 @@ def decode_payload(part: Message) -> str:
     return ""
 
 
+def parse_mail(data: str) -> Message | None:
+    """Parse an uploaded mail strictly. This runs in a separate process"""
+    try:
+        return message_from_string(data, policy=STRICT_POLICY)
+    except MessageDefect:
+        return None
+
+
+def split_parts(message: Message) -> MailParts:
+    """Collect the bodies and attachments of the mail in a single walk"""
+    if not message.is_multipart():
+        if message.get_content_type() == "text/html":
+            return MailParts(None, decode_payload(message), [], {})
+        return MailParts(decode_payload(message), None, [], {})
+
+    bodies: dict[str, str] = {}
+    attachments: list[str | None] = []
+    index: dict[str, Message] = {}
+    for part in message.walk():
+        if part.get_content_disposition() == "attachment":
+            name = part.get_filename()
+            if name:
+                index.setdefault(name, part)
+            attachments.append(name)
+        elif (ctype := part.get_content_type()) in BODY_TYPES and ctype not in bodies:
+            # Only decode the first body of each type
+            bodies[ctype] = decode_payload(part)
+
+    return MailParts(
+        bodies.get("text/plain"), bodies.get("text/html"), attachments, index
+    )
+
+
+def parse_stored_mail(content: bytes) -> Tuple[Message, MailParts]:
+    message = message_from_bytes(content)
+    return message, split_parts(message)
+
+
+def mail_size(mail: CachedMail) -> int:
+    """Approximate the memory held by a cached mail"""
+    if mail.content:
+        return len(mail.content)
+
+    # Derived mails aren't serialized and their payloads dominate the size
+    return sum(
+        len(str(part.get_payload()))
+        for part in mail.message.walk()
+        if not part.is_multipart()
+    )
+
+
+def cache_key(digest: bytes) -> str:
+    """Encode 16 bytes as URL safe key with 22 characters"""
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
 def flags_to_api(flags: frozenset[Flag]) -> list[str]:
     return [f.value.decode().strip("\\").lower() for f in flags]
 
@@ -58,9 +227,11 @@ async def run_app(
     host: str | None = None,
     port: int | None = None,
     ssl_context: ssl.SSLContext | None = None,
+    access_log: bool = True,
 ) -> web.AppRunner:
     app = web.AppRunner(
         api,
+        access_log=access_logger if access_log else None,
         access_log_format='%a "%r" %s %b "%{Referer}i" "%{User-Agent}i"',
     )
     await app.setup()
@@ -98,15 +269,38 @@ class Frontend:
         self.user: str = user
         self.devel: str = devel
         self.flagged_seen: bool = flagged_seen
+        self.default_flags: frozenset[Flag] = frozenset(
+            {system_flag("seen")} if flagged_seen else []
+        )
         self.ensure_message_id = ensure_message_id
         self.client_max_size: int = client_max_size
         self.multi_user: bool = multi_user
 
-        self.mail_cache: dict[str, Tuple[str, str, int]] = {}
+        self.mail_cache: utils.LRUCache[str, CachedMail] = utils.LRUCache(
+            MAIL_CACHE_SIZE, mail_size
+        )
+        self.parsed_mails: utils.LRUCache[Tuple[str, str, int], ParsedMail] = (
+            utils.LRUCache(PARSED_CACHE_SIZE, lambda parsed: len(parsed.content))
+        )
+        self.mail_headers: utils.LRUCache[Tuple[str, str, int], CachedHeader] = (
+            utils.LRUCache(HEADER_CACHE_SIZE)
+        )
+        self.parse_pool: ProcessPoolExecutor | None = None
+        self.static_cache: dict[str, StaticResource] = {}
+
+        # Websocket commands are dispatched to the on_<command> methods
+        self.commands: dict[str, Callable[..., Awaitable[None]]] = {
+            name[3:]: func
+            for name in dir(self)
+            if name.startswith("on_") and callable(func := getattr(self, name))
+        }
 
     def load_resource(self, resource: str) -> str:
+        return self.load_resource_bytes(resource).decode("utf-8")
+
+    def load_resource_bytes(self, resource: str) -> bytes:
         if self.devel:  # pragma: no cover
-            with open(os.path.join(self.devel, resource), encoding="utf-8") as fp:
+            with open(os.path.join(self.devel, resource), "rb") as fp:
                 return fp.read()
 
         package = f"{__package__}.resources"
@@ -114,28 +308,129 @@ class Frontend:
         if not res.is_file():
             raise FileNotFoundError()
 
-        return res.read_text(encoding="utf-8")
+        return res.read_bytes()
+
+    def load_static(self, resource: str) -> StaticResource:
+        """Load the resource with the compressed version and ETag. The result is
+        cached unless the files are served from the working directory"""
+        if resource in self.static_cache:
+            return self.static_cache[resource]
+
+        body = self.load_resource_bytes(resource)
+        # Both representations need their own strong ETag
+        digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+        static = StaticResource(
+            body=body,
+            compressed=gzip.compress(body, compresslevel=9),
+            etag=f'"{digest}"',
+            compressed_etag=f'"{digest}-gz"',
+        )
+        if not self.devel:
+            self.static_cache[resource] = static
+        return static
+
+    def _static_response(
+        self, request: Request, resource: str, content_type: str
+    ) -> Response:
+        static = self.load_static(resource)
+        headers = {"Vary": "Accept-Encoding"}
+        accept = request.headers.get("Accept-Encoding", "")
+        if utils.accepts_encoding(accept, "gzip"):
+            headers["Content-Encoding"] = "gzip"
+            body, headers["ETag"] = static.compressed, static.compressed_etag
+        else:
+            body, headers["ETag"] = static.body, static.etag
+
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            return Response(status=304, headers=headers)
+
+        return Response(
+            body=body, content_type=content_type, charset="utf-8", headers=headers
+        )
 
     async def start(self) -> web.AppRunner:
+        if not self.devel:
+            package = f"{__package__}.resources"
+            for res in resources.files(package).iterdir():
+                if res.name.endswith((".css", ".html", ".js")):
+                    self.load_static(res.name)
+
         self.api = web.Application(client_max_size=self.client_max_size)
 
-        self.api.add_routes(
-            [
-                web.get("/", self._page_index),
-                web.get(r"/{static:.*\.(css|js)}", self._page_static),
-                web.get("/websocket", self._websocket),
-                web.get(
-                    r"/attachment/{mail:.*}/{attachment:.*}", self._download_attachment
-                ),
-            ]
-        )
+        routes = [
+            web.get("/", self._page_index),
+            web.get("/websocket", self._websocket),
+            web.get(
+                r"/attachment/{mail:[A-Za-z0-9_-]{22}}/{attachment:.+}",
+                self._download_attachment,
+            ),
+            web.get(r"/source/{mail:[A-Za-z0-9_-]{22}}", self._download_source),
+        ]
+        if self.devel:
+            routes.append(web.get(r"/{static:.*\.(css|js)}", self._page_static))
+        else:
+            # Plain routes of the preloaded resources are dispatched without
+            # matching a pattern
+            for name in self.static_cache:
+                mimetype = STATIC_TYPES.get(name.rsplit(".", 1)[-1])
+                if mimetype:
+                    routes.append(
+                        web.get(f"/{name}", self._static_handler(name, mimetype))
+                    )
+
+        self.api.add_routes(routes)
+        self.api.on_cleanup.append(self._shutdown_parse_pool)
 
         return await run_app(
             self.api,
             host=self.host or None,
             port=self.port,
+            # Only log the requests while developing the frontend
+            access_log=bool(self.devel),
         )
 
+    async def _shutdown_parse_pool(self, _app: web.Application) -> None:
+        if self.parse_pool:
+            self.parse_pool.shutdown(cancel_futures=True)
+            self.parse_pool = None
+
+    def _get_parse_pool(self) -> ProcessPoolExecutor:
+        # Spawn the workers because forking a process with running threads,
+        # e.g. the SMTP controllers, isn't safe
+        if not self.parse_pool:
+            self.parse_pool = ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.parse_pool
+
+    async def _parse_mails(self, mails: list[Mail]) -> list[Message | None]:
+        """Parse the mails in the process pool. Mails which fail are skipped and
+        a pool broken by a crashed worker is replaced for the next upload"""
+        loop = asyncio.get_running_loop()
+        pool = self._get_parse_pool()
+        try:
+            results = await asyncio.gather(
+                *(loop.run_in_executor(pool, parse_mail, m["data"]) for m in mails),
+                return_exceptions=True,
+            )
+        except BrokenProcessPool:
+            # The pool can also break between two uploads
+            results = [BrokenProcessPool()]
+
+        if any(isinstance(res, BrokenProcessPool) for res in results):
+            _logger.error("Mail parsing pool broke and is restarted")
+            pool.shutdown(wait=False, cancel_futures=True)
+            if self.parse_pool is pool:
+                self.parse_pool = None
+
+        for res in results:
+            if isinstance(res, BaseException):
+                _logger.warning(f"Skipping mail which failed to parse: {res!r}")
+        return [res for res in results if not isinstance(res, BaseException)]
+
+    async def send_json(self, ws: WebSocketResponse, data: Any) -> None:
+        await ws.send_str(utils.json_dumps(data))
+
     async def _websocket(self, request: Request) -> WebSocketResponse:
         ws = WebSocketResponse()
         await ws.prepare(request)
@@ -146,7 +441,7 @@ class Frontend:
                 continue
 
             try:
-                data = json.loads(msg.data)
+                data = utils.json_loads(msg.data)
             except json.JSONDecodeError:
                 continue
 
@@ -158,34 +453,36 @@ class Frontend:
                 await ws.close()
                 continue
 
-            func = getattr(self, f"on_{command}", None)
-            if callable(func):
+            func = self.commands.get(command)
+            if func:
                 await func(ws, **data)
 
         _logger.info(f"Disconnected websocket: {request.remote}")
         return ws
 
-    async def _page_index(self, request: Request) -> Response:  # pylint: disable=W0613
+    async def _page_index(self, request: Request) -> Response:
         try:
-            return Response(
-                body=self.load_resource("index.html"),
-                content_type="text/html",
-            )
+            return self._static_response(request, "index.html", "text/html")
         except FileNotFoundError as e:  # pragma: no cover
             _logger.error("File 'index.html' not in resources")
             raise web.HTTPNotFound() from e
 
+    def _static_handler(
+        self, resource: str, content_type: str
+    ) -> Callable[[Request], Awaitable[Response]]:
+        async def handler(request: Request) -> Response:
+            return self._static_response(request, resource, content_type)
+
+        return handler
+
     async def _page_static(self, request: Request) -> Response:
         static = request.match_info["static"]
-        if static.endswith(".js"):
-            mimetype = "text/javascript"
-        elif static.endswith(".css"):
-            mimetype = "text/css"
-        else:  # pragma: no cover
+        mimetype = STATIC_TYPES.get(static.rsplit(".", 1)[-1])
+        if not mimetype:  # pragma: no cover
             raise web.HTTPNotFound()
 
         try:
-            return Response(body=self.load_resource(static), content_type=mimetype)
+            return self._static_response(request, static, mimetype)
         except FileNotFoundError as e:  # pragma: no cover
             _logger.error(f"File {static!r} not in resources")
             raise web.HTTPNotFound() from e
@@ -193,11 +490,63 @@ class Frontend:
     async def _message_content(self, msg: PyMapMessage) -> bytes:
         return bytes((await msg.load_content(FetchRequirement.CONTENT)).content)
 
+    async def _message_header(
+        self, msg: PyMapMessage, account: str, mailbox: str
+    ) -> dict[str, str]:
+        """Decode the header of the stored mail once. pymap already split it
+        from the body and it's enough for the mail listing"""
+        key = (account, mailbox, msg.uid)
+        cached = self.mail_headers.get(key)
+        if cached is None or cached.internal_date != msg.internal_date:
+            loaded = await msg.load_content(FetchRequirement.HEADER)
+            # Don't look for the parts of multipart mails without a body
+            message = HEADER_PARSER.parsebytes(
+                bytes(loaded.content.header), headersonly=True
+            )
+            cached = CachedHeader(msg.internal_date, decode_headers(message))
+            self.mail_headers.put(key, cached)
+        return cached.header
+
+    async def _parse_message(
+        self, msg: PyMapMessage, account: str, mailbox: str
+    ) -> ParsedMail:
+        """Parse and hash the stored mail once and reuse the result afterwards.
+        The internal date guards against reused UIDs of recreated mailboxes"""
+        key = (account, mailbox, msg.uid)
+        parsed = self.parsed_mails.get(key)
+        if parsed is None or parsed.internal_date != msg.internal_date:
+            content = await self._message_content(msg)
+            # Keep large mails from blocking the other websocket commands. The
+            # hashing releases the GIL and runs in parallel to the parsing
+            (message, parts), msg_hash = await asyncio.gather(
+                asyncio.to_thread(parse_stored_mail, content),
+                asyncio.to_thread(self.message_hash, content),
+            )
+            parsed = ParsedMail(msg.internal_date, content, message, msg_hash, parts)
+            self.parsed_mails.put(key, parsed)
+        return parsed
+
     def message_hash(self, content: bytes | str) -> str:
         if isinstance(content, str):
             content = content.encode()
 
-        return hashlib.sha512(content).hexdigest()
+        if blake3 is not None:  # pragma: no cover
+            return cache_key(blake3(content).digest(length=16))
+        return cache_key(hashlib.blake2b(content, digest_size=16).digest())
+
+    def cache_mail(self, msg_hash: str, mail: CachedMail) -> None:
+        """Remember the parsed mail and drop the least recently used ones"""
+        self.mail_cache.put(msg_hash, mail)
+
+    async def _find_message(
+        self, account: str, mailbox: str, uid: int
+    ) -> PyMapMessage | None:
+        try:
+            mbox = await self.mailboxes[account].get_mailbox(mailbox)
+        except (IndexError, KeyError):  # pragma: no cover
+            return None
+
+        return await get_message(mbox, uid)
 
     async def _convert_message(
         self,
@@ -207,52 +556,51 @@ class Frontend:
         mailbox: str,
         full: bool = False,
         message: Message | None = None,
-    ) -> Mail:
-        if not message:
-            content = await self._message_content(msg)
-            message = message_from_bytes(content)
+    ) -> MailView:
+        if message is None:
+            header = await self._message_header(msg, account, mailbox)
         else:
-            content = message.as_bytes()
+            header = decode_headers(message)
 
-        result = {
-            "uid": msg.uid,
-            "flags": flags_to_api(msg.permanent_flags),
-            "header": {k.lower(): decode_header(v) for k, v in message.items()},
-            "date": msg.internal_date.isoformat(),
-        }
+        result = MailView(
+            uid=msg.uid,
+            flags=flags_to_api(msg.permanent_flags),
+            header=header,
+            date=msg.internal_date,
+        )
 
         if not full:
             return result
 
-        msg_hash = self.message_hash(content)
-        self.mail_cache[msg_hash] = (account, mailbox, msg.uid)
-
-        attachments = []
-        if message.is_multipart():
-            for part in message.walk():
-                ctype = part.get_content_type()
-                cdispo = part.get_content_disposition()
-
-                if cdispo == "attachment":
-                    name = part.get_filename()
-                    attachments.append(
-                        {"name": name, "url": f"/attachment/{msg_hash}/{name}"}
-                    )
-                elif ctype == "text/plain":
-                    result["body_plain"] = decode_payload(part)
-                elif ctype == "text/html":
-                    result["body_html"] = decode_payload(part)
-        elif message.get_content_type() == "text/html":
-            result["body_html"] = decode_payload(message)
+        if message is None:
+            parsed = await self._parse_message(msg, account, mailbox)
+            msg_hash, content, message = parsed.msg_hash, parsed.content, parsed.message
+            parts = parsed.parts
         else:
-            result["body_plain"] = decode_payload(message)
+            # Derived mails like replies aren't stored and a content hash can't
+            # be reused. A random key keeps their sources from being guessed
+            # and they are only serialized if the source is requested
+            msg_hash = cache_key(secrets.token_bytes(16))
+            content, parts = b"", split_parts(message)
+
+        self.cache_mail(
+            msg_hash,
+            CachedMail(account, mailbox, msg.uid, message, parts.by_name, content),
+        )
 
-        result["attachments"] = attachments
-        result["content"] = bytes(content).decode()
+        result.body_plain = parts.body_plain
+        result.body_html = parts.body_html
+        result.attachments = [
+            {"name": name, "url": f"/attachment/{msg_hash}/{name}"}
+            for name in parts.attachments
+        ]
+        # The source is only loaded by the frontend when shown
+        result.source = f"/source/{msg_hash}"
         return result
 
     async def on_config(self, ws: WebSocketResponse) -> None:
-        await ws.send_json(
+        await self.send_json(
+            ws,
             {
                 "command": "config",
                 "data": {
@@ -260,30 +608,32 @@ class Frontend:
                     "flagged_seen": self.flagged_seen,
                     "version": VERSION,
                 },
-            }
+            },
         )
 
     async def on_list_accounts(self, ws: WebSocketResponse) -> None:
-        await ws.send_json(
+        await self.send_json(
+            ws,
             {
                 "command": "list_accounts",
                 "data": {
                     "accounts": await self.mailboxes.list(),
                 },
-            }
+            },
         )
 
     async def on_list_mailboxes(self, ws: WebSocketResponse, account: str) -> None:
         acc = await self.mailboxes.get(account)
         mailboxes = await acc.list_mailboxes()
-        await ws.send_json(
+        await self.send_json(
+            ws,
             {
                 "command": "list_mailboxes",
                 "data": {
                     "account": account,
                     "mailboxes": sorted(m.name for m in mailboxes.list()),
                 },
-            }
+            },
         )
 
     async def on_add_mailbox(
@@ -321,11 +671,18 @@ class Frontend:
 
             mailboxes = await acc.list_mailboxes()
             to_delete = [m.name for m in mailboxes.list() if m.name.startswith(name)]
-            for mbox_name in sorted(to_delete, reverse=True):
+            # Delete the children before their parents
+            to_delete.sort(reverse=True)
+            for mbox_name in to_delete:
                 await acc.delete_mailbox(mbox_name)
         except (IndexError, KeyError):  # pragma: no cover
             return
 
+        # Recreated mailboxes start with the same UIDs again
+        deleted = {(account, mbox_name) for mbox_name in to_delete}
+        self.parsed_mails.evict(lambda key: key[:2] in deleted)
+        self.mail_headers.evict(lambda key: key[:2] in deleted)
+
         await self.on_list_mailboxes(ws, account)
 
     async def on_move_mail(
@@ -351,6 +708,8 @@ class Frontend:
             return
 
         await mbox_from.move(mail_uid, mbox_to)
+        self.parsed_mails.pop((account, mailbox_from, mail_uid))
+        self.mail_headers.pop((account, mailbox_from, mail_uid))
 
         await self.on_list_mails(ws, account, mailbox_from)
 
@@ -368,47 +727,55 @@ class Frontend:
         except (IndexError, KeyError):  # pragma: no cover
             return
 
-        result = [
-            await self._convert_message(msg, account=account, mailbox=mailbox)
-            async for msg in mbox.messages()
-        ]
-
-        result.sort(key=lambda x: x["date"], reverse=True)  # type: ignore
+        # Sort by the timestamp instead of the converted ISO string. IMAP APPEND
+        # stores timezone aware dates while the local delivery uses naive ones
+        messages = [msg async for msg in mbox.messages()]
+        messages.sort(key=lambda msg: msg.internal_date.timestamp(), reverse=True)
+        result = await asyncio.gather(
+            *(
+                self._convert_message(msg, account=account, mailbox=mailbox)
+                for msg in messages
+            )
+        )
 
-        await ws.send_json(
+        await self.send_json(
+            ws,
             {
                 "command": "list_mails",
-                "data": {"account": account, "mailbox": mailbox, "mails": result},
-            }
+                "data": {
+                    "account": account,
+                    "mailbox": mailbox,
+                    "mails": [mail.to_json() for mail in result],
+                },
+            },
         )
 
     async def on_get_mail(
         self, ws: WebSocketResponse, account: str, mailbox: str, uid: int
     ) -> None:
-        try:
-            mbox = await self.mailboxes[account].get_mailbox(mailbox)
-        except (IndexError, KeyError):  # pragma: no cover
+        msg = await self._find_message(account, mailbox, uid)
+        if msg is None:
             return
 
-        async for msg in mbox.messages():
-            if msg.uid == uid:
-                await ws.send_json(
-                    {
-                        "command": "get_mail",
-                        "data": {
-                            "account": account,
-                            "mailbox": mailbox,
-                            "uid": uid,
-                            "mail": await self._convert_message(
-                                msg,
-                                account=account,
-                                mailbox=mailbox,
-                                full=True,
-                            ),
-                        },
-                    }
-                )
-                break
+        message = await self._convert_message(
+            msg,
+            account=account,
+            mailbox=mailbox,
+            full=True,
+        )
+
+        await self.send_json(
+            ws,
+            {
+                "command": "get_mail",
+                "data": {
+                    "account": account,
+                    "mailbox": mailbox,
+                    "uid": uid,
+                    "mail": message.to_json(),
+                },
+            },
+        )
 
     async def on_random_mail(
         self, ws: WebSocketResponse, account: str, mailbox: str
@@ -420,7 +787,8 @@ class Frontend:
             "from": Builder.mail_address(),
         }
         _logger.info("Randomized mail")
-        await ws.send_json(
+        await self.send_json(
+            ws,
             {
                 "command": "random_mail",
                 "data": {
@@ -431,42 +799,39 @@ class Frontend:
                         "body_plain": f"Body {uuid.uuid4()}",
                     },
                 },
-            }
+            },
         )
 
     async def on_reply_mail(
         self, ws: WebSocketResponse, account: str, mailbox: str, uid: int
     ) -> None:
-        try:
-            mbox = await self.mailboxes[account].get_mailbox(mailbox)
-        except (IndexError, KeyError):  # pragma: no cover
+        msg = await self._find_message(account, mailbox, uid)
+        if msg is None:
             return
 
-        async for msg in mbox.messages():
-            if msg.uid == uid:
-                content = await self._message_content(msg)
-                reply = Builder.reply_mail(message_from_bytes(content))
-
-                message = await self._convert_message(
-                    msg,
-                    account=account,
-                    mailbox=mailbox,
-                    full=True,
-                    message=reply,
-                )
-
-                await ws.send_json(
-                    {
-                        "command": "reply_mail",
-                        "data": {
-                            "account": account,
-                            "mailbox": mailbox,
-                            "uid": uid,
-                            "mail": message,
-                        },
-                    }
-                )
-                break
+        parsed = await self._parse_message(msg, account, mailbox)
+        reply = Builder.reply_mail(parsed.message)
+
+        message = await self._convert_message(
+            msg,
+            account=account,
+            mailbox=mailbox,
+            full=True,
+            message=reply,
+        )
+
+        await self.send_json(
+            ws,
+            {
+                "command": "reply_mail",
+                "data": {
+                    "account": account,
+                    "mailbox": mailbox,
+                    "uid": uid,
+                    "mail": message.to_json(),
+                },
+            },
+        )
 
     async def on_flag_mail(
         self,
@@ -477,32 +842,38 @@ class Frontend:
         method: str,
         flag: str,
     ) -> None:
-        try:
-            mbox = await self.mailboxes[account].get_mailbox(mailbox)
-            method = method.lower()
-
-            if method in ("unset", "set"):
-                flags = [Flag(b"\\" + flag.title().encode())]
-            else:
-                flags = []
-        except (IndexError, KeyError):  # pragma: no cover
+        msg = await self._find_message(account, mailbox, uid)
+        if msg is None:
             return
 
-        async for msg in mbox.messages():
-            if msg.uid != uid:
-                continue
+        method = method.lower()
+        if method in ("unset", "set"):
+            flags = [system_flag(flag)]
+        else:
+            flags = []
 
-            if method == "unset":
-                msg.permanent_flags = msg.permanent_flags.difference(flags)
-            elif method == "set":
-                msg.permanent_flags = msg.permanent_flags.union(flags)
+        if method == "unset":
+            msg.permanent_flags = msg.permanent_flags.difference(flags)
+        elif method == "set":
+            msg.permanent_flags = msg.permanent_flags.union(flags)
 
-            _logger.info(
-                f"{method.title()} flag {flag} of mail {uid}: {flags}: {msg.permanent_flags}"
-            )
+        _logger.info(
+            f"{method.title()} flag {flag} of mail {uid}: {flags}: {msg.permanent_flags}"
+        )
 
-            await self.on_list_mails(ws, account, mailbox)
-            break
+        # Only the flagged mail changed which spares the whole listing
+        mail = await self._convert_message(msg, account=account, mailbox=mailbox)
+        await self.send_json(
+            ws,
+            {
+                "command": "flag_mail",
+                "data": {
+                    "account": account,
+                    "mailbox": mailbox,
+                    "mail": mail.to_json(),
+                },
+            },
+        )
 
     async def on_upload_mails(
         self,
@@ -511,24 +882,22 @@ class Frontend:
         mailbox: str | None,
         mails: list[Mail],
     ) -> None:
-        compat_strict = policy.compat32.clone(raise_on_defect=True)
+        # The email parser is pure Python and the mails are parsed in parallel
         counter = 0
-        for mail in mails:
-            try:
-                msg = message_from_string(mail["data"], policy=compat_strict)
-
-                if not msg["Message-Id"] and self.ensure_message_id:
-                    msg.add_header("Message-Id", Builder.message_id())
-
-                await self.mailboxes.append(
-                    msg,
-                    flags=frozenset({Flag(b"\\Seen")} if self.flagged_seen else []),
-                    mailbox=mailbox or "INBOX",
-                )
-                counter += 1
-            except MessageDefect:
+        for msg in await self._parse_mails(mails):
+            if msg is None:
                 continue
 
+            if not msg["Message-Id"] and self.ensure_message_id:
+                msg.add_header("Message-Id", Builder.message_id())
+
+            await self.mailboxes.append(
+                msg,
+                flags=self.default_flags,
+                mailbox=mailbox or "INBOX",
+            )
+            counter += 1
+
         if counter:
             _logger.info(f"Uploaded {counter} mails")
             await self.on_list_mails(ws, account, mailbox)
@@ -544,8 +913,14 @@ class Frontend:
         if not isinstance(header, dict) or not isinstance(body, str):
             return
 
-        message = MIMEMultipart()
-        message.attach(MIMEText(body))
+        # Only build a multipart mail if there are attachments
+        attachments = mail.get("attachments") or []
+        message: Message
+        if attachments:
+            message = MIMEMultipart()
+            message.attach(Builder.text_part(body))
+        else:
+            message = Builder.text_part(body)
 
         for key, value in header.items():
             if key.strip() and value.strip():
@@ -554,7 +929,7 @@ class Frontend:
         if not message["Message-Id"] and self.ensure_message_id:
             message.add_header("Message-Id", Builder.message_id())
 
-        for att in mail.get("attachments", []):
+        for att in attachments:
             part = MIMEBase(*(att["mimetype"] or "text/plain").split("/"))
             part.set_payload(att["content"])
             part.add_header("Content-Transfer-Encoding", "base64")
@@ -566,47 +941,47 @@ class Frontend:
 
         await self.mailboxes.append(
             message,
-            flags=frozenset({Flag(b"\\Seen")} if self.flagged_seen else []),
+            flags=self.default_flags,
             mailbox=mailbox or "INBOX",
         )
         _logger.info("New mail sent")
         await self.on_list_mails(ws, account, mailbox)
 
-    async def _download_attachment(self, request: Request) -> Response:
-        try:
-            mail_hash = request.match_info["mail"]
-            if mail_hash not in self.mail_cache:
-                raise web.HTTPNotFound()
-
-            account, mailbox, uid = self.mail_cache[mail_hash]
-            attachment = request.match_info["attachment"]
-            mbox = await self.mailboxes[account].get_mailbox(mailbox)
-        except (IndexError, KeyError) as e:  # pragma: no cover
-            self.mail_cache.pop(mail_hash, None)
-            raise web.HTTPNotFound() from e
+    async def _download_source(self, request: Request) -> Response:
+        mail_hash = request.match_info["mail"]
+        cached = self.mail_cache.get(mail_hash)
+        if not cached:
+            raise web.HTTPNotFound()
 
-        message = None
-        async for msg in mbox.messages():
-            if msg.uid == uid:
-                content = await self._message_content(msg)
-                message = message_from_bytes(content)
+        return web.Response(
+            body=cached.content or cached.message.as_bytes(),
+            content_type="text/plain",
+            charset="utf-8",
+        )
 
-        if not message or not message.is_multipart():
+    async def _download_attachment(self, request: Request) -> web.StreamResponse:
+        mail_hash = request.match_info["mail"]
+        cached = self.mail_cache.get(mail_hash)
+        if not cached:
             raise web.HTTPNotFound()
 
-        for part in message.walk():
-            if (
-                part.get_content_disposition() == "attachment"
-                and part.get_filename() == attachment
-            ):
-                cte = part.get("Content-Transfer-Encoding")
-                body = part.get_payload(decode=bool(cte))
-                return web.Response(
-                    body=body,
-                    headers={
-                        "Content-Type": part.get("Content-Type", ""),
-                        "Content-Disposition": part.get("Content-Disposition", ""),
-                    },
-                )
+        part = cached.attachments.get(request.match_info["attachment"])
+        if part is None:
+            raise web.HTTPNotFound()
 
-        raise web.HTTPNotFound()
+        headers = {
+            "Content-Type": part.get("Content-Type", ""),
+            "Content-Disposition": part.get("Content-Disposition", ""),
+        }
+        cte = part.get("Content-Transfer-Encoding")
+        payload = part.get_payload()
+        if not cte or cte.lower() != "base64" or not isinstance(payload, str):
+            body = part.get_payload(decode=True) if cte else payload
+            return web.Response(body=body, headers=headers)
+
+        response = web.StreamResponse(headers=headers)
+        await response.prepare(request)
+        for chunk in utils.iter_b64decode(payload):
+            await response.write(chunk)
+        await response.write_eof()
+        return response
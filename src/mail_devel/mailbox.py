@@ -1,3 +1,5 @@
+import asyncio
+import functools
 import logging
 from datetime import datetime
 from email.message import Message
@@ -6,11 +8,36 @@ from email.utils import getaddresses
 from pymap.backend.dict import Config
 from pymap.backend.dict.filter import FilterSet
 from pymap.backend.dict.mailbox import MailboxData, MailboxSet
+from pymap.backend.dict.mailbox import Message as PyMapMessage
 from pymap.parsing.message import AppendMessage
 from pymap.parsing.specials.flag import Flag
 
 _logger = logging.getLogger(__name__)
 
+# Headers with the recipients of a mail
+ADDRESS_HEADERS = frozenset({"to", "cc", "bcc"})
+
+
+@functools.lru_cache(maxsize=32)
+def system_flag(name: str | bytes) -> Flag:
+    """Build the system flag like \\Seen from the name. Flags are immutable which
+    allows to reuse them"""
+    if isinstance(name, str):
+        name = name.encode()
+    return Flag(b"\\" + name.title())
+
+
+async def get_message(mailbox: MailboxData, uid: int) -> PyMapMessage | None:
+    """Get a message of the mailbox by the UID without iterating all messages"""
+    async with mailbox.messages_lock.read_lock():
+        return mailbox._messages.get(uid)
+
+
+async def count_messages(mailbox: MailboxData) -> int:
+    """Count the messages of the mailbox without iterating them"""
+    async with mailbox.messages_lock.read_lock():
+        return len(mailbox._messages)
+
 
 class TestMailboxSet(MailboxSet):
     """This MailboxSet creates the mailboxes automatically"""
@@ -41,7 +68,7 @@ class TestMailboxDict:
         stats = {}
         for user, (mset, _fset) in self.config.set_cache.items():
             mbox = await mset.get_mailbox("INBOX")
-            stats[user] = len([msg async for msg in mbox.messages()])
+            stats[user] = await count_messages(mbox)
         return stats
 
     async def list(self) -> list[str]:
@@ -68,14 +95,14 @@ class TestMailboxDict:
     ) -> None:
         """Push the message to the correct mailbox"""
 
-        # Strip BCC header and collect the mail addresses
-        addresses: set[str] = set()
-        for header, value in message.items():
-            if value and header.lower() in ("to", "cc", "bcc"):
-                addresses.update(x.strip() for x in value.split(","))
-
-            if header.lower() == "bcc":
-                message._headers.remove((header, value))  # type: ignore
+        # Collect the address headers and strip the BCC header. getaddresses
+        # handles commas in quoted display names
+        addresses = [
+            value
+            for header, value in message.items()
+            if value and header.lower() in ADDRESS_HEADERS
+        ]
+        del message["Bcc"]
 
         append_msg = AppendMessage(
             literal=str(message).encode(),
@@ -89,8 +116,13 @@ class TestMailboxDict:
             await mailboxset.append(append_msg)
             return
 
-        for _, address in getaddresses(list(addresses)):
-            if address:
-                account = await self.get(address)
-                mbox = await account.get_mailbox(mailbox)
-                await mbox.append(append_msg)
+        # Deliver to every recipient once and concurrently
+        recipients = {addr for _, addr in getaddresses(addresses) if addr}
+        await asyncio.gather(
+            *(self._deliver(addr, append_msg, mailbox) for addr in recipients)
+        )
+
+    async def _deliver(self, user: str, message: AppendMessage, mailbox: str) -> None:
+        account = await self.get(user)
+        mbox = await account.get_mailbox(mailbox)
+        await mbox.append(message)
@@ -45,6 +45,7 @@ class MailClient {
     this.mailbox_name = null;
     this.mail_uid = null;
     this.mail_selected = null;
+    this.mail_source = null;
     this.content_mode = "html";
     this.editor_mode = "simple";
     this.config = {};
@@ -385,6 +386,19 @@ class MailClient {
       this.mailbox.append(line);
   }
 
+  async on_flag_mail(data) {
+    const mail = data?.mail;
+    if (!mail || data.mailbox !== this.mailbox_name)
+      return;
+
+    for (const line of this.mailbox.children) {
+      if (line.uid === mail.uid) {
+        await this._mail_row_fill(line, mail);
+        break;
+      }
+    }
+  }
+
   async load_mail(uid) {
     await this.socket_send(
       {
@@ -419,9 +433,32 @@ class MailClient {
     if (!mail?.body_html && self.content_mode === "html")
       self.content_mode = "plain";
 
+    if (self.content_mode === "source")
+      await self.load_source();
+
     await self.visibility();
   }
 
+  async load_source() {
+    const url = this.mail_source;
+    const uid = this.mail_uid;
+    if (!url)
+      return;
+
+    // Keep the URL on failures to allow another try
+    const response = await fetch(url);
+    if (!response.ok)
+      return;
+
+    const source = await response.text();
+    // Another mail could have been selected in the meantime
+    if (uid !== this.mail_uid || url !== this.mail_source)
+      return;
+
+    this.mail_source = null;
+    document.querySelector("#mail-content textarea#source").value = source;
+  }
+
   async send_mail() {
     const headers = {};
     for (const key of this.fixed_headers)
@@ -599,7 +636,8 @@ class MailClient {
     document.querySelector("#header-cc input").value = data?.header?.cc || "";
     document.querySelector("#header-bcc input").value = data?.header?.bcc || "";
     document.querySelector("#header-subject input").value = data?.header?.subject || "";
-    document.querySelector("#mail-content textarea#source").value = data?.content || "";
+    document.querySelector("#mail-content textarea#source").value = "";
+    this.mail_source = data?.source || null;
     document.querySelector("#mail-content textarea#plain").value = data?.body_plain || "";
     document.querySelector("#mail-content iframe#html").srcdoc = data?.body_html || "";
   }
@@ -692,6 +730,7 @@ class MailClient {
     document.getElementById("btn-source").addEventListener("click", (ev) => {
       ev.preventDefault();
       self.content_mode = "source";
+      self.load_source();
       self.visibility();
     });
 
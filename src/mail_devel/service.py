@@ -5,24 +5,28 @@ import os
 import secrets
 import ssl
 from contextlib import AsyncExitStack, asynccontextmanager
-from typing import AsyncGenerator
-
-from aiosmtpd.controller import Controller
-from pymap.backend.dict import Config, DictBackend
-from pymap.backend.dict.filter import FilterSet
-from pymap.imap import IMAPService
+from typing import TYPE_CHECKING, AsyncGenerator
 
 from . import utils
-from .auth import IMAPAuthenticator, SMTPAuthenticator
-from .http import Frontend
-from .mailbox import TestMailboxDict
-from .smtp import MemoryHandler
 
 try:
     from typing import Self
 except ImportError:
     from typing_extensions import Self
 
+# The server components are imported lazily in Service.init to keep the start
+# of the command line interface fast, e.g. for --help
+if TYPE_CHECKING:
+    from aiosmtpd.controller import Controller
+    from pymap.backend.dict import Config, DictBackend
+    from pymap.backend.dict.filter import FilterSet
+    from pymap.imap import IMAPService
+
+    from .auth import IMAPAuthenticator
+    from .http import Frontend
+    from .mailbox import TestMailboxDict
+    from .smtp import MemoryHandler
+
 _logger = logging.getLogger(__name__)
 
 
@@ -79,12 +83,20 @@ class Service:
 
     @classmethod
     async def init(cls, args: argparse.Namespace) -> Self:
+        # pylint: disable=import-outside-toplevel
+        from pymap.backend.dict import Config, DictBackend
+        from pymap.backend.dict.filter import FilterSet
+        from pymap.imap import IMAPService
+
+        from .auth import IMAPAuthenticator
+        from .http import Frontend
+        from .mailbox import TestMailboxDict
+
         service = cls(args)
+        http_host = args.http_host or args.host
 
         if args.cert and args.key:
-            service.ssl_context = utils.generate_ssl_context(
-                cert=args.cert, key=args.key
-            )
+            service.ssl_context = utils.load_ssl_context(args.cert, args.key)
 
         # Create the IMAP and optionally IMAPS service
         service.filter_set = FilterSet()
@@ -101,76 +113,98 @@ class Service:
         service.imap = IMAPService(service.backend, service.config)
 
         # Create the SMTP and optionally SMTPS service
-        service.handler = MemoryHandler(
-            service.mailboxes,
+        service._init_smtp(service.mailboxes)
+
+        # Create the HTTP service
+        if args.http:
+            service.frontend = Frontend(
+                service.mailboxes,
+                user=args.user,
+                host=http_host,
+                port=args.http_port,
+                devel=args.devel,
+                flagged_seen=args.flagged_seen or args.http_flagged_seen,
+                ensure_message_id=not args.no_message_id or not args.http_no_message_id,
+                client_max_size=args.client_max_size,
+                multi_user=args.multi_user,
+            )
+
+        return service
+
+    def _init_smtp(self, mailboxes: "TestMailboxDict") -> None:
+        # pylint: disable=import-outside-toplevel
+        from aiosmtpd.controller import Controller
+
+        from .auth import SMTPAuthenticator
+        from .smtp import MemoryHandler
+
+        args = self.args
+        smtp_host = args.smtp_host or args.host
+        self.handler = MemoryHandler(
+            mailboxes,
             flagged_seen=args.flagged_seen or args.smtp_flagged_seen,
             ensure_message_id=not args.no_message_id or not args.smtp_no_message_id,
             multi_user=args.multi_user,
             responder=args.smtp_responder,
         )
-        service.smtp = Controller(
-            service.handler,
-            hostname=args.smtp_host or args.host,
+        authenticator = SMTPAuthenticator(args.user, args.password, args.multi_user)
+        self.smtp = Controller(
+            self.handler,
+            hostname=smtp_host,
             port=args.smtp_port,
-            tls_context=service.ssl_context,
+            tls_context=self.ssl_context,
             auth_required=args.auth_required,
             auth_require_tls=args.auth_require_tls,
             require_starttls=args.starttls_required,
             enable_SMTPUTF8=True,
-            authenticator=SMTPAuthenticator(
-                args.user,
-                args.password,
-                args.multi_user,
-            ),
+            authenticator=authenticator,
         )
 
-        if service.ssl_context:
-            service.smtps = Controller(
-                service.handler,
-                hostname=args.smtp_host or args.host,
+        if self.ssl_context:
+            self.smtps = Controller(
+                self.handler,
+                hostname=smtp_host,
                 port=args.smtps_port,
-                ssl_context=service.ssl_context,
+                ssl_context=self.ssl_context,
                 auth_required=args.auth_required,
                 auth_require_tls=args.auth_require_tls,
                 enable_SMTPUTF8=True,
-                authenticator=SMTPAuthenticator(
-                    args.user,
-                    args.password,
-                    args.multi_user,
-                ),
+                authenticator=authenticator,
             )
 
-        # Create the HTTP service
-        if args.http:
-            service.frontend = Frontend(
-                service.mailboxes,
-                user=args.user,
-                host=args.http_host or args.host,
-                port=args.http_port,
-                devel=args.devel,
-                flagged_seen=args.flagged_seen or args.http_flagged_seen,
-                ensure_message_id=not args.no_message_id or not args.http_no_message_id,
-                client_max_size=args.client_max_size,
-                multi_user=args.multi_user,
-            )
+    async def _start_frontend(self, stack: AsyncExitStack) -> None:
+        if self.frontend:
+            runner = await self.frontend.start()
+            stack.push_async_callback(runner.cleanup)
 
-        return service
+    async def _start_smtp(
+        self, stack: AsyncExitStack, controller: "Controller"
+    ) -> None:
+        # The controller blocks until its thread is ready
+        await asyncio.to_thread(controller.start)
+        stack.callback(controller.stop)
 
     @asynccontextmanager
     async def start(self) -> AsyncGenerator[None, None]:
-        loop = asyncio.get_event_loop()
-        if self.frontend:
-            loop.create_task(self.frontend.start())
-
         async with AsyncExitStack() as stack:
+            # The services are independent from each other and can be started
+            # concurrently. Every service registers its stop once it started
+            tasks = [self._start_frontend(stack)]
             if self.backend:
-                await self.backend.start(stack)
+                tasks.append(self.backend.start(stack))
             if self.imap:
-                await self.imap.start(stack)
+                tasks.append(self.imap.start(stack))
             if self.smtp:
-                self.smtp.start()
+                tasks.append(self._start_smtp(stack, self.smtp))
             if self.smtps:
-                self.smtps.start()
+                tasks.append(self._start_smtp(stack, self.smtps))
+
+            # Let all starts finish before raising so that the started services
+            # are stopped again by the exit stack
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
 
             self.log_connection_info()
             yield
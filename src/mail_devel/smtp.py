@@ -1,19 +1,20 @@
 import importlib
 import importlib.util
+import inspect
 import logging
 import os
 import re
 from email.message import Message
 from logging import Logger
 from types import ModuleType
-from typing import Callable, Iterable, Type
+from typing import Awaitable, Callable, Iterable, Type
 
 from aiosmtpd.handlers import AsyncMessage
 from aiosmtpd.smtp import Envelope, Session
 from pymap.parsing.specials.flag import Flag
 
 from .builder import Builder
-from .mailbox import TestMailboxDict
+from .mailbox import TestMailboxDict, system_flag
 
 _logger = logging.getLogger(__name__)
 _reply_logger = logging.getLogger(f"{__name__}.reply")
@@ -31,7 +32,9 @@ def dummy(_message: Message, _flags: set[str], _logger: logging.Logger) -> Reply
 
 
 __all__ = ["Flag", "Logger", "Message", "Reply"]
-Responder = Callable[[Message, set[str], logging.Logger], Reply]
+Responder = Callable[
+    [Message, set[str], logging.Logger], Reply | None | Awaitable[Reply | None]
+]
 
 
 class MemoryHandler(AsyncMessage):
@@ -60,15 +63,10 @@ class MemoryHandler(AsyncMessage):
     def _convert_flags(
         self, flags: Iterable[bytes | str | Flag] | None
     ) -> frozenset[Flag]:
-        result = []
-        for flag in flags or []:
-            if isinstance(flag, str):
-                result.append(Flag(b"\\" + flag.title().encode()))
-            elif isinstance(flag, bytes):
-                result.append(Flag(b"\\" + flag.title()))
-            else:
-                result.append(flag)
-        return frozenset(result)
+        return frozenset(
+            flag if isinstance(flag, Flag) else system_flag(flag)
+            for flag in flags or []
+        )
 
     def _load_responder_from_script(self, script: ModuleType) -> Responder | None:
         responder = getattr(script, "reply", None)
@@ -128,7 +126,8 @@ class MemoryHandler(AsyncMessage):
                 break
 
     async def auto_respond(self, message: Message) -> None:
-        """Auto responder when a new message arrives via smtp"""
+        """Auto responder when a new message arrives via smtp. The responder can
+        be a function or coroutine function"""
         if not self.responder or not callable(self.responder):
             return
 
@@ -137,6 +136,9 @@ class MemoryHandler(AsyncMessage):
             self._default_flags(),
             _reply_logger,
         )
+        if inspect.isawaitable(reply):
+            reply = await reply
+
         if isinstance(reply, Reply) and reply.message:
             await self.mailboxes.append(
                 reply.message,
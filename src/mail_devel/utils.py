@@ -1,7 +1,25 @@
+import functools
+import json
 import logging
 import os
+import re
 import ssl
 import sys
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Generic, Hashable, Iterator, TypeVar
+
+# Prefer the faster orjson for the websocket messages if available
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+# Use the SIMD accelerated base64 decoder if available
+try:
+    from pybase64 import b64decode
+except ImportError:
+    from base64 import b64decode  # type: ignore[assignment,unused-ignore]
 
 VERSION = "0.14.1"
 
@@ -19,6 +37,12 @@ LOG_LEVELS = {
 
 _logger = logging.getLogger(__name__)
 
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# Everything outside of the base64 alphabet including the padding
+B64_SKIP = re.compile(r"[^A-Za-z0-9+/]+")
+
 
 def configure_logging(level_name: str, log_file: str | None = None) -> None:
     """Configure the logging"""
@@ -92,6 +116,21 @@ def generate_ssl_context(
     return ctx
 
 
+@functools.lru_cache(maxsize=8)
+def _cached_ssl_context(
+    cert: str, key: str, _cert_mtime: int, _key_mtime: int
+) -> ssl.SSLContext:
+    return generate_ssl_context(cert=cert, key=key)
+
+
+def load_ssl_context(cert: str, key: str) -> ssl.SSLContext:
+    """Generate a SSL context for the certificate and key. The context is cached
+    and only regenerated if one of the files changes"""
+    return _cached_ssl_context(
+        cert, key, os.stat(cert).st_mtime_ns, os.stat(key).st_mtime_ns
+    )
+
+
 def convert_size(x: str) -> int:
     x = x.upper()
     for c, m in {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}.items():
@@ -100,6 +139,106 @@ def convert_size(x: str) -> int:
     return int(float(x))
 
 
+def accepts_encoding(accept: str, encoding: str) -> bool:
+    """Check if the Accept-Encoding header allows the content coding. Codings
+    with a quality of 0 are explicitly refused"""
+    qualities = {}
+    for item in accept.split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    return qualities.get(encoding, qualities.get("*", 0.0)) > 0
+
+
+def iter_b64decode(data: str, size: int = 1 << 16) -> Iterator[bytes]:
+    """Decode base64 data in chunks to avoid a full copy of large payloads.
+    Characters outside of the alphabet are skipped like the email package does"""
+    rest = ""
+    for i in range(0, len(data), size):
+        chunk = rest + B64_SKIP.sub("", data[i : i + size])
+        cut = len(chunk) - len(chunk) % 4
+        rest = chunk[cut:]
+        if cut:
+            yield b64decode(chunk[:cut])
+
+    # A single trailing character can't encode a full byte
+    if len(rest) > 1:
+        yield b64decode(rest + "=" * (-len(rest) % 4))
+
+
+class LRUCache(Generic[K, V]):
+    """Mapping which drops the least recently used entries once it grows
+    beyond the maximum size. Without a weigh function every entry counts
+    as one towards the size"""
+
+    def __init__(self, maxsize: int, weigh: Callable[[V], int] | None = None) -> None:
+        self.maxsize: int = maxsize
+        self.weigh: Callable[[V], int] = weigh or (lambda _: 1)
+        self.size: int = 0
+        self.data: OrderedDict[K, V] = OrderedDict()
+
+    def __contains__(self, key: K) -> bool:
+        return key in self.data
+
+    def __getitem__(self, key: K) -> V:
+        return self.data[key]
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def get(self, key: K) -> V | None:
+        """Return the value of the key and mark it as recently used"""
+        value = self.data.get(key)
+        if value is not None:
+            self.data.move_to_end(key)
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        """Store the value as the most recently used one"""
+        self.pop(key)
+        self.data[key] = value
+        self.size += self.weigh(value)
+        while self.size > self.maxsize:
+            _, dropped = self.data.popitem(last=False)
+            self.size -= self.weigh(dropped)
+
+    def pop(self, key: K) -> V | None:
+        value = self.data.pop(key, None)
+        if value is not None:
+            self.size -= self.weigh(value)
+        return value
+
+    def evict(self, condition: Callable[[K], bool]) -> None:
+        """Drop all entries with a key matching the condition"""
+        for key in [key for key in self.data if condition(key)]:
+            self.pop(key)
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def json_dumps(obj: Any) -> str:
+    # orjson serializes datetimes natively in the ISO format
+    if orjson:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, default=_json_default)
+
+
+def json_loads(data: str | bytes) -> Any:
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
 def valid_file(path: str, is_directory: bool = False) -> str:
     """Check if a file exists and return the absolute path otherwise raise an
     error. This function is used for the argument parsing"""
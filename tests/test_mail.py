@@ -1,18 +1,25 @@
 import argparse
 import asyncio
+import os
+import socket
+import time
+from concurrent.futures.process import BrokenProcessPool
 from contextlib import asynccontextmanager
+from datetime import datetime
+from email import message_from_string
 from imaplib import IMAP4
 from random import randint
 from secrets import token_hex
 from smtplib import SMTP, SMTPAuthenticationError
 from threading import Thread
 from typing import Any, AsyncGenerator, Callable, Iterable, Tuple
-from unittest.mock import patch
+from unittest import mock
 
 import pytest
 from aiohttp import ClientSession
 from mail_devel import Service
 from mail_devel import __main__ as main
+from mail_devel.http import CachedHeader, CachedMail, mail_size
 from mail_devel.smtp import Flag
 
 MAIL = """
@@ -165,6 +172,28 @@ async def test_service() -> None:
 
         assert len([msg async for msg in mailbox.messages()]) == 1
         assert len([msg async for msg in sent.messages()]) == 0
+        assert await service.mailboxes.inbox_stats() == {service.demo_user: 1}
+
+
+@pytest.mark.asyncio
+async def test_service_start_failure() -> None:
+    smtp_port, http_port = unused_ports(2)
+    pw = token_hex(10)
+    service = await build_test_service(pw, smtp_port=smtp_port, http_port=http_port)
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", http_port))
+        sock.listen()
+
+        with pytest.raises(OSError):
+            async with service.start():
+                pass
+
+    # The SMTP controller started and has to release its port again even if
+    # it finished starting after the frontend failed
+    await asyncio.sleep(0.5)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", smtp_port))
 
 
 @pytest.mark.asyncio
@@ -177,6 +206,30 @@ async def test_http_static() -> None:
         async with session.get("/unknown.css") as response:
             assert response.status == 404
 
+        async with session.get("/main.js") as response:
+            assert response.headers["Content-Encoding"] == "gzip"
+            etag = response.headers["ETag"]
+
+        headers = {"If-None-Match": etag}
+        async with session.get("/main.js", headers=headers) as response:
+            assert response.status == 304
+
+        # The uncompressed version has a different ETag
+        headers = {"If-None-Match": etag, "Accept-Encoding": "gzip;q=0, deflate"}
+        async with session.get("/main.js", headers=headers) as response:
+            assert response.status == 200
+            assert "Content-Encoding" not in response.headers
+            assert response.headers["ETag"] != etag
+
+
+def test_mail_size() -> None:
+    message = message_from_string(MAIL)
+    stored = CachedMail("test", "INBOX", 1, message, {}, MAIL.encode())
+    assert mail_size(stored) == len(MAIL)
+
+    derived = stored._replace(content=b"")
+    assert 0 < mail_size(derived) < len(MAIL)
+
 
 @pytest.mark.asyncio
 async def test_websocket() -> None:
@@ -206,13 +259,37 @@ async def test_http_upload() -> None:
                     "command": "upload_mails",
                     "account": service.demo_user,
                     "mailbox": "INBOX",
-                    "mails": [{"data": MAIL}, {"data": mail_no_id}],
+                    # Invalid mails are skipped without losing the others
+                    "mails": [{"data": MAIL}, {"data": 42}, {"data": mail_no_id}],
                 }
             )
             data = await ws.receive_json()
             assert data["command"] == "list_mails"
             assert len(data["data"]["mails"]) == 3
 
+            # Crash a worker which breaks the whole pool
+            frontend = service.frontend
+            assert frontend
+            pool = frontend.parse_pool
+            assert pool
+            with pytest.raises(BrokenProcessPool):
+                await asyncio.get_running_loop().run_in_executor(pool, os._exit, 1)
+
+            upload = {
+                "command": "upload_mails",
+                "account": service.demo_user,
+                "mailbox": "INBOX",
+                "mails": [{"data": MAIL}],
+            }
+            await ws.send_json(upload)
+            with pytest.raises(TimeoutError):
+                await ws.receive_json(timeout=0.5)
+            assert frontend.parse_pool is None
+
+            await ws.send_json(upload)
+            data = await ws.receive_json()
+            assert len(data["data"]["mails"]) == 4
+
 
 @pytest.mark.asyncio
 async def test_http() -> None:
@@ -258,6 +335,23 @@ async def test_http() -> None:
             assert data["data"]["mail"]
             assert data["data"]["mail"]["attachments"]
 
+            assert service.frontend
+            user = service.demo_user
+            assert user is not None
+            key = (user, "INBOX", 101)
+            parsed = service.frontend.parsed_mails[key]
+            await ws.send_json(
+                {
+                    "command": "get_mail",
+                    "account": service.demo_user,
+                    "mailbox": "INBOX",
+                    "uid": 101,
+                }
+            )
+            data = await ws.receive_json()
+            assert data["data"]["mail"]["attachments"]
+            assert service.frontend.parsed_mails[key] is parsed
+
             await ws.send_json(
                 {
                     "command": "get_mail",
@@ -270,6 +364,34 @@ async def test_http() -> None:
                 await ws.receive_json(timeout=0.25)
 
 
+def imap_append(port: int, user: str, password: str, message: str) -> None:
+    with IMAP4("localhost", port=port) as mbox:
+        mbox.login(user, password)
+        mbox.append("INBOX", "", time.time(), message.encode())
+
+
+@pytest.mark.asyncio
+async def test_http_list_mixed_dates() -> None:
+    async with prepare_http_test() as (session, service):
+        # IMAP APPEND stores timezone aware dates unlike the SMTP delivery
+        args = service.args
+        await asyncio.to_thread(
+            imap_append, args.imap_port, args.user, args.password, MAIL
+        )
+
+        async with session.ws_connect("/websocket") as ws:
+            await ws.send_json(
+                {
+                    "command": "list_mails",
+                    "account": service.demo_user,
+                    "mailbox": "INBOX",
+                }
+            )
+            data = await ws.receive_json()
+            assert data["command"] == "list_mails"
+            assert len(data["data"]["mails"]) == 2
+
+
 @pytest.mark.asyncio
 async def test_http_random() -> None:
     async with prepare_http_test() as (session, service):
@@ -304,6 +426,16 @@ async def test_http_reply() -> None:
             msg = data["data"]["mail"]
             assert msg["header"]["to"] == "test <test@example.org>"
             assert "@mail-devel" in msg["header"]["message-id"]
+            # The original mail has no References header to append
+            message_id = "<ce22c843-2061-33e9-403c-40ef9261a2cf@example.org>"
+            assert msg["header"]["in-reply-to"] == message_id
+            assert msg["header"]["references"] == message_id
+            # Only the first text/plain part is quoted and not the attachment
+            assert msg["body_plain"] == "Reply\n\n> hello world<br/>hello world 2\n> "
+
+            async with session.get(msg["source"]) as response:
+                assert response.status == 200
+                assert "Subject: Re: hello" in await response.text()
 
             await ws.send_json(
                 {
@@ -379,9 +511,9 @@ async def test_http_flagging() -> None:
                 }
             )
             data = await ws.receive_json()
-            assert data["command"] == "list_mails"
-            assert data["data"]["mails"][0]["uid"] == 101
-            assert data["data"]["mails"][0]["flags"] == ["seen"]
+            assert data["command"] == "flag_mail"
+            assert data["data"]["mail"]["uid"] == 101
+            assert data["data"]["mail"]["flags"] == ["seen"]
 
             await ws.send_json(
                 {
@@ -394,9 +526,9 @@ async def test_http_flagging() -> None:
                 }
             )
             data = await ws.receive_json()
-            assert data["command"] == "list_mails"
-            assert data["data"]["mails"][0]["uid"] == 101
-            assert data["data"]["mails"][0]["flags"] == ["seen"]
+            assert data["command"] == "flag_mail"
+            assert data["data"]["mail"]["uid"] == 101
+            assert data["data"]["mail"]["flags"] == ["seen"]
 
             await ws.send_json(
                 {
@@ -409,9 +541,9 @@ async def test_http_flagging() -> None:
                 }
             )
             data = await ws.receive_json()
-            assert data["command"] == "list_mails"
-            assert data["data"]["mails"][0]["uid"] == 101
-            assert data["data"]["mails"][0]["flags"] == []
+            assert data["command"] == "flag_mail"
+            assert data["data"]["mail"]["uid"] == 101
+            assert data["data"]["mail"]["flags"] == []
 
             await ws.send_json(
                 {
@@ -469,6 +601,12 @@ async def test_http_mailboxes() -> None:
             assert data["command"] == "list_mailboxes"
             assert set(data["data"]["mailboxes"]) == {*mailboxes, "test", "test/test"}
 
+            user = service.demo_user
+            assert user is not None
+            header = CachedHeader(datetime.now(), {})
+            for name in ("INBOX", "test", "test/test"):
+                frontend.mail_headers.put((user, name, 1), header)
+
             await ws.send_json(
                 {
                     "command": "delete_mailbox",
@@ -480,6 +618,7 @@ async def test_http_mailboxes() -> None:
             data = await ws.receive_json()
             assert data["command"] == "list_mailboxes"
             assert set(data["data"]["mailboxes"]) == set(mailboxes)
+            assert list(frontend.mail_headers.data) == [(user, "INBOX", 1)]
 
 
 @pytest.mark.asyncio
@@ -512,6 +651,13 @@ async def test_http_attachment() -> None:
             async with session.get("/attachment/invalid/att abc.txt") as response:
                 assert response.status == 404
 
+            async with session.get(data["data"]["mail"]["source"]) as response:
+                assert response.status == 200
+                assert "Subject: hello" in await response.text()
+
+            async with session.get(f"/source/{'A' * 22}") as response:
+                assert response.status == 404
+
 
 @pytest.mark.asyncio
 async def test_smtp_auth() -> None:
@@ -665,12 +811,22 @@ async def test_imap_auth_multi_user_mails() -> None:
 
 
 @pytest.mark.asyncio
-async def test_main_sleep_forever() -> None:
-    with patch("asyncio.sleep", autospec=True) as mock:
-        mock.side_effect = [None] * 10 + [GeneratorExit()]
-        with pytest.raises(GeneratorExit):
-            await main.sleep_forever()
-        assert mock.call_count == 11  # 10 calls + GeneratorExit
+async def test_multi_user_recipients() -> None:
+    iport, sport = unused_ports(2)
+    service = await build_test_service(
+        token_hex(10), imap_port=iport, smtp_port=sport, multi_user=None, no_http=None
+    )
+    assert service.mailboxes
+
+    message = message_from_string(
+        'To: "Doe, John" <john@localhost>\nCc: john@localhost\n'
+        "Subject: hello\n\nhello world\n"
+    )
+    await service.mailboxes.append(message, frozenset())
+
+    stats = await service.mailboxes.inbox_stats()
+    assert stats["john@localhost"] == 1
+    assert not any("Doe" in user or "John" in user for user in stats)
 
 
 @pytest.mark.asyncio
@@ -693,6 +849,20 @@ async def test_main() -> None:
             "--no-http",
         ]
     )
-    with patch("mail_devel.__main__.sleep_forever", autospec=True) as mock:
-        await main.run(args)
-        mock.assert_called_once()
+    ready, stop = asyncio.Event(), asyncio.Event()
+    start = Service.start
+
+    @asynccontextmanager
+    async def start_and_notify(self: Service) -> AsyncGenerator[None, None]:
+        async with start(self):
+            ready.set()
+            yield
+
+    # Stay below the timeout of the test run
+    with mock.patch.object(Service, "start", start_and_notify):
+        task = asyncio.create_task(main.run(args, stop))
+        await asyncio.wait_for(ready.wait(), 2)
+        assert not task.done()
+
+        stop.set()
+        await asyncio.wait_for(task, 2)
@@ -1,4 +1,6 @@
+import base64
 import logging
+import os
 import ssl
 import subprocess
 
@@ -26,6 +28,12 @@ def test_generate_ssl_context() -> None:
     assert len(server.get_ciphers())
 
 
+def test_load_ssl_context() -> None:
+    server = utils.load_ssl_context(SERVER_CERT, SERVER_KEY)
+    assert isinstance(server, ssl.SSLContext)
+    assert utils.load_ssl_context(SERVER_CERT, SERVER_KEY) is server
+
+
 def test_configure_logging() -> None:
     utils.configure_logging("INFO", None)
     log = logging.getLogger()
@@ -40,6 +48,60 @@ def test_convert_size() -> None:
     assert utils.convert_size("1.5K") == 1536
 
 
+def test_accepts_encoding() -> None:
+    assert utils.accepts_encoding("gzip, deflate, br", "gzip")
+    assert utils.accepts_encoding("deflate, GZIP;q=0.5", "gzip")
+    assert utils.accepts_encoding("*", "gzip")
+    assert not utils.accepts_encoding("", "gzip")
+    assert not utils.accepts_encoding("gzip;q=0", "gzip")
+    assert not utils.accepts_encoding("gzip;q=0.0, *", "gzip")
+    assert not utils.accepts_encoding("x-gzip", "gzip")
+    assert not utils.accepts_encoding("gzip;q=invalid", "gzip")
+
+
+def test_iter_b64decode() -> None:
+    data = os.urandom(3000)
+    encoded = base64.encodebytes(data).decode()
+    assert b"".join(utils.iter_b64decode(encoded, 100)) == data
+    assert b"".join(utils.iter_b64decode(encoded)) == data
+    assert b"".join(utils.iter_b64decode("aGVsbG8gd29ybGQ")) == b"hello world"
+
+    # Malformed payloads with stray characters and broken padding
+    malformed = "aGVs*bG8g\nd29y!bGQ=\n"
+    assert b"".join(utils.iter_b64decode(malformed, 4)) == b"hello world"
+    assert b"".join(utils.iter_b64decode("aGVsbG8gd29ybGQh5")) == b"hello world!"
+    noisy = "".join(f"{c}#" for c in encoded)
+    assert b"".join(utils.iter_b64decode(noisy, 100)) == data
+
+
+def test_lru_cache() -> None:
+    cache: utils.LRUCache[str, int] = utils.LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert len(cache) == 2
+    assert cache["a"] == 1
+    assert cache.pop("a") == 1
+    assert cache.pop("a") is None
+    assert cache.get("a") is None
+
+    cache.put("a", 1)
+    cache.evict(lambda key: key in "ac")
+    assert len(cache) == 0
+
+    sized: utils.LRUCache[str, bytes] = utils.LRUCache(10, len)
+    sized.put("a", b"12345")
+    sized.put("b", b"1234")
+    sized.put("b", b"123456")
+    assert "a" not in sized
+    assert sized.size == 6
+    sized.put("c", b"12345678901")
+    assert len(sized) == 0
+    assert sized.size == 0
+
+
 def test_valid_file() -> None:
     with pytest.raises(FileNotFoundError):
         assert utils.valid_file(__file__ + "a")